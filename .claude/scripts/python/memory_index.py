@@ -0,0 +1,402 @@
+#!/usr/bin/env python3
+# Script: memory_index.py
+# Description: Índice incremental (SQLite FTS5) sobre .claude/memory/ para injeção de contexto com orçamento
+# Usage: memory_index.py {update|query|compact|stats} [opções]
+# Created: 2026-10-18
+"""Índice local da memória permanente.
+
+Os hooks não injetam mais arquivos inteiros: cada arquivo ``.md`` da memória
+é quebrado em entradas (uma por seção ``##``/``###``) e indexado em SQLite
+FTS5. A reindexação é incremental — só arquivos com ``mtime``/tamanho
+alterados são relidos, e só os com hash diferente são reprocessados.
+
+Subcomandos:
+    update   sincroniza o índice com .claude/memory/
+    query    imprime as top-k entradas relevantes à tarefa, dentro de um
+             orçamento de tokens e de um limite de tempo rígido
+    compact  remove blocos repetidos dos context-snapshots (roda em background
+             a partir do pre-compact hook)
+    stats    resumo do índice
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import sqlite3
+import sys
+import time
+from pathlib import Path
+
+PROJECT_DIR = Path(os.environ.get("CLAUDE_PROJECT_DIR", Path.cwd()))
+MEMORY_DIR = Path(os.environ.get("CLAUDE_MEMORY_DIR", PROJECT_DIR / ".claude" / "memory"))
+INDEX_PATH = MEMORY_DIR / ".index" / "memory.sqlite"
+SNAPSHOT_DIR = "context-snapshots"
+
+DEFAULT_K = 8
+DEFAULT_BUDGET = 1500      # tokens injetados por sessão
+DEFAULT_TIMEOUT = 2.0      # segundos; o hook nunca espera mais que isso
+REINDEX_SHARE = 0.5        # fração do timeout para reindexar; o resto fica reservado à consulta
+MAX_INLINE_BYTES = 256 * 1024  # arquivos maiores só são reindexados pelo `update`, sem limite de tempo
+CHARS_PER_TOKEN = 4        # aproximação suficiente para orçamento
+KEEP_SNAPSHOTS = 3         # snapshots mais recentes ficam intactos
+MAX_SNAPSHOT_HITS = 2      # snapshots por consulta, para não afogar erros/padrões
+
+TITLE_RE = re.compile(r"^#\s+(.*\S)\s*$")
+HEADING_RE = re.compile(r"^(#{2,3})\s+(.*\S)\s*$")
+TOKEN_RE = re.compile(r"[\w.\-/]{3,}", re.UNICODE)
+COMPACT_MARK = "<!-- compactado:"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path  TEXT PRIMARY KEY,
+    mtime REAL NOT NULL,
+    size  INTEGER NOT NULL,
+    hash  TEXT NOT NULL
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS entries USING fts5(
+    title, body,
+    path UNINDEXED, kind UNINDEXED, mtime UNINDEXED, hash UNINDEXED,
+    tokenize = 'unicode61 remove_diacritics 2'
+);
+"""
+
+
+class Deadline:
+    """Limite de tempo de uma etapa de um comando."""
+
+    def __init__(self, seconds):
+        self.end = time.monotonic() + seconds
+
+    def expired(self):
+        return time.monotonic() >= self.end
+
+
+def connect(index_path=INDEX_PATH, timeout=1.0):
+    """Abre o índice; ``timeout`` é a espera máxima por lock de outro processo."""
+    index_path.parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(index_path, timeout=timeout)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def wait_for_locks(conn, deadline):
+    """Espera por lock do SQLite (``busy_timeout``) só até o ``deadline``."""
+    conn.execute("PRAGMA busy_timeout = %d" % max(0, int((deadline.end - time.monotonic()) * 1000)))
+
+
+def estimate_tokens(text):
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def content_hash(text):
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+
+def kind_of(rel_path):
+    """Categoria da entrada: primeiro diretório abaixo de memory/."""
+    parts = Path(rel_path).parts
+    return parts[0] if len(parts) > 1 else "root"
+
+
+def split_entries(text, fallback_title):
+    """Quebra um markdown em (título, corpo) por seção ``##``/``###``.
+
+    O preâmbulo antes do primeiro heading vira uma entrada própria com o
+    título ``#`` do arquivo (ou o nome do arquivo); seções vazias são
+    descartadas.
+    """
+    entries, title, lines = [], fallback_title, []
+    in_fence = False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_fence = not in_fence
+        if line.startswith(COMPACT_MARK):
+            continue
+        title_match = None if in_fence else TITLE_RE.match(line)
+        if title_match and not entries and not any(lines):
+            title = title_match.group(1)
+            continue
+        match = None if in_fence else HEADING_RE.match(line)
+        if match:
+            entries.append((title, "\n".join(lines).strip()))
+            title, lines = match.group(2), []
+        else:
+            lines.append(line)
+    entries.append((title, "\n".join(lines).strip()))
+    return [(t, b) for t, b in entries if b]
+
+
+def iter_memory_files(memory_dir=MEMORY_DIR):
+    for path in sorted(memory_dir.rglob("*.md")):
+        if ".index" in path.parts:
+            continue
+        yield path
+
+
+def update_index(conn, memory_dir=MEMORY_DIR, deadline=None):
+    """Sincroniza o índice; retorna (reindexados, removidos, pulados).
+
+    Arquivos com ``mtime``/tamanho iguais nem são lidos. Com ``deadline``, o
+    limite vale também dentro de cada arquivo: arquivos acima de
+    ``MAX_INLINE_BYTES`` são pulados, e uma escrita no SQLite que estoure o
+    prazo é interrompida e desfeita. O que sobrar fica para a próxima
+    execução — o índice antigo continua consultável.
+    """
+    known = {row[0]: row[1:] for row in conn.execute("SELECT path, mtime, size, hash FROM files")}
+    seen, reindexed, skipped = set(), 0, 0
+    if deadline is not None:
+        conn.set_progress_handler(lambda: 1 if deadline.expired() else 0, 1000)
+
+    try:
+        for path in iter_memory_files(memory_dir):
+            rel = path.relative_to(memory_dir).as_posix()
+            seen.add(rel)
+            if deadline is not None and deadline.expired():
+                skipped += 1
+                continue
+            stat = path.stat()
+            previous = known.get(rel)
+            if previous and previous[0] == stat.st_mtime and previous[1] == stat.st_size:
+                continue
+            if deadline is not None and stat.st_size > MAX_INLINE_BYTES:
+                skipped += 1
+                continue
+            text = path.read_text(encoding="utf-8", errors="replace")
+            digest = content_hash(text)
+            entries = split_entries(text, path.stem)
+            if deadline is not None and deadline.expired():
+                skipped += 1
+                continue
+            try:
+                with conn:
+                    if previous and previous[2] == digest:
+                        conn.execute("UPDATE files SET mtime = ?, size = ? WHERE path = ?",
+                                     (stat.st_mtime, stat.st_size, rel))
+                        continue
+                    conn.execute("DELETE FROM entries WHERE path = ?", (rel,))
+                    conn.executemany(
+                        "INSERT INTO entries (title, body, path, kind, mtime, hash) VALUES (?, ?, ?, ?, ?, ?)",
+                        [
+                            (title, body, rel, kind_of(rel), stat.st_mtime, content_hash(body))
+                            for title, body in entries
+                        ],
+                    )
+                    conn.execute("INSERT OR REPLACE INTO files (path, mtime, size, hash) VALUES (?, ?, ?, ?)",
+                                 (rel, stat.st_mtime, stat.st_size, digest))
+            except sqlite3.OperationalError:
+                if deadline is None or not deadline.expired():
+                    raise
+                skipped += 1  # interrompido pelo deadline; a transação foi desfeita
+                continue
+            reindexed += 1
+
+        removed = [path for path in known if path not in seen]
+        if deadline is not None and deadline.expired():
+            removed = []  # remoções também ficam para a próxima execução
+        with conn:
+            for rel in removed:
+                conn.execute("DELETE FROM entries WHERE path = ?", (rel,))
+                conn.execute("DELETE FROM files WHERE path = ?", (rel,))
+    except sqlite3.OperationalError:
+        if deadline is None or not deadline.expired():
+            raise
+        removed = []
+    finally:
+        conn.set_progress_handler(None, 0)
+    return reindexed, len(removed), skipped
+
+
+def match_expression(task):
+    """Converte texto livre em expressão FTS5 (OR de termos entre aspas)."""
+    terms = dict.fromkeys(term.lower() for term in TOKEN_RE.findall(task))
+    return " OR ".join('"%s"' % term.replace('"', "") for term in terms)
+
+
+def search(conn, task, k=DEFAULT_K, deadline=None):
+    """Top-k entradas por BM25; sem tarefa, as entradas mais recentes.
+
+    Snapshots pesam menos que erros/padrões/ADRs: são contexto bruto e
+    costumam repetir o que já está documentado.
+    """
+    if deadline is not None:
+        # Aborta a consulta no SQLite se o limite de tempo estourar.
+        conn.set_progress_handler(lambda: 1 if deadline.expired() else 0, 1000)
+    expression = match_expression(task or "")
+    try:
+        if expression:
+            rows = conn.execute(
+                "SELECT title, body, path, kind, hash, "
+                "bm25(entries, 2.0, 1.0) * (CASE kind WHEN ? THEN 0.5 ELSE 1.0 END) AS rank "
+                "FROM entries WHERE entries MATCH ? ORDER BY rank, mtime DESC LIMIT ?",
+                (SNAPSHOT_DIR, expression, k * 3),
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT title, body, path, kind, hash, 0 FROM entries "
+                "WHERE kind != ? ORDER BY mtime DESC LIMIT ?",
+                (SNAPSHOT_DIR, k * 3),
+            ).fetchall()
+    except sqlite3.OperationalError:
+        return []
+    finally:
+        conn.set_progress_handler(None, 0)
+
+    results, seen, snapshots = [], set(), 0
+    for title, body, path, kind, digest, _rank in rows:
+        if digest in seen:
+            continue
+        if kind == SNAPSHOT_DIR:
+            if snapshots == MAX_SNAPSHOT_HITS:
+                continue
+            snapshots += 1
+        seen.add(digest)
+        results.append({"title": title, "body": body, "path": path, "kind": kind})
+        if len(results) == k:
+            break
+    return results
+
+
+def render(results, budget=DEFAULT_BUDGET):
+    """Monta o bloco injetado respeitando o orçamento de tokens.
+
+    A última entrada que não couber inteira é truncada; as seguintes são
+    descartadas.
+    """
+    parts, remaining = [], budget
+    for entry in results:
+        header = "### %s (`%s`)\n" % (entry["title"], entry["path"])
+        cost = estimate_tokens(header + entry["body"])
+        if cost <= remaining:
+            parts.append(header + entry["body"])
+            remaining -= cost
+            continue
+        room = (remaining - estimate_tokens(header)) * CHARS_PER_TOKEN
+        if room > 200:
+            parts.append(header + entry["body"][:room].rstrip() + "\n[...]")
+        break
+    return "\n\n".join(parts)
+
+
+def inject(conn, task, k=DEFAULT_K, budget=DEFAULT_BUDGET, timeout=DEFAULT_TIMEOUT, memory_dir=MEMORY_DIR):
+    """Texto que o hook injeta: reindexa numa fatia do tempo e consulta no resto.
+
+    A reindexação para em ``REINDEX_SHARE`` do timeout, e a consulta fica com
+    o que sobrar até ``timeout`` — o total nunca passa do limite. Com muitos
+    arquivos alterados, o índice existente continua respondendo e o restante
+    é reindexado nas próximas execuções.
+    Se outro processo segura o lock de escrita (um ``update`` ou ``compact``
+    em paralelo), a reindexação é abandonada e a consulta usa o índice atual.
+    """
+    start = time.monotonic()
+    reindex_deadline = Deadline(timeout * REINDEX_SHARE)
+    wait_for_locks(conn, reindex_deadline)
+    try:
+        update_index(conn, memory_dir, deadline=reindex_deadline)
+    except sqlite3.OperationalError:
+        pass  # "database is locked": o índice antigo continua consultável
+    query_deadline = Deadline(timeout - (time.monotonic() - start))
+    wait_for_locks(conn, query_deadline)
+    return render(search(conn, task, k, query_deadline), budget)
+
+
+def compact_snapshots(memory_dir=MEMORY_DIR, keep=KEEP_SNAPSHOTS):
+    """Deduplica ``context-snapshots/``; retorna (removidos, compactados).
+
+    Snapshots idênticos a um anterior são apagados. Dos demais, exceto os
+    ``keep`` mais recentes, saem os blocos (parágrafos) que já apareceram
+    em snapshots mais antigos — o arquivo passa a guardar só o delta.
+    """
+    snapshot_dir = memory_dir / SNAPSHOT_DIR
+    if not snapshot_dir.is_dir():
+        return 0, 0
+    snapshots = sorted(snapshot_dir.glob("*.md"), key=lambda p: p.stat().st_mtime)
+    recent = set(snapshots[-keep:]) if keep > 0 else set()
+    seen_files, seen_blocks = set(), set()
+    removed = compacted = 0
+
+    for path in snapshots:
+        text = path.read_text(encoding="utf-8", errors="replace")
+        digest = content_hash(text)
+        if digest in seen_files:
+            path.unlink()
+            removed += 1
+            continue
+        seen_files.add(digest)
+
+        blocks = [block.strip() for block in re.split(r"\n\s*\n", text) if block.strip()]
+        if path in recent or text.startswith(COMPACT_MARK):
+            seen_blocks.update(content_hash(block) for block in blocks)
+            continue
+        kept, dropped = [], 0
+        for block in blocks:
+            block_hash = content_hash(block)
+            # Headings são mantidos para o delta continuar legível.
+            if block_hash in seen_blocks and not block.startswith("#"):
+                dropped += 1
+                continue
+            seen_blocks.add(block_hash)
+            kept.append(block)
+        if dropped:
+            stat = path.stat()
+            body = "%s %d blocos repetidos removidos -->\n\n%s\n" % (COMPACT_MARK, dropped, "\n\n".join(kept))
+            tmp = path.with_suffix(".md.tmp")
+            tmp.write_text(body, encoding="utf-8")
+            os.replace(tmp, path)
+            # Preserva a ordem cronológica usada na compactação seguinte.
+            os.utime(path, (stat.st_atime, stat.st_mtime))
+            seen_files.add(content_hash(body))
+            compacted += 1
+    return removed, compacted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Índice incremental de .claude/memory/")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("update", help="Sincroniza o índice")
+    query = sub.add_parser("query", help="Top-k entradas relevantes à tarefa")
+    query.add_argument("task", nargs="?", help="Texto da tarefa (padrão: stdin)")
+    query.add_argument("-k", type=int, default=int(os.environ.get("MEMORY_TOP_K", DEFAULT_K)))
+    query.add_argument("--budget", type=int, default=int(os.environ.get("MEMORY_TOKEN_BUDGET", DEFAULT_BUDGET)))
+    query.add_argument("--timeout", type=float, default=float(os.environ.get("MEMORY_TIMEOUT_S", DEFAULT_TIMEOUT)))
+    compact = sub.add_parser("compact", help="Deduplica context-snapshots/")
+    compact.add_argument("--keep", type=int, default=KEEP_SNAPSHOTS)
+    sub.add_parser("stats", help="Resumo do índice")
+    args = parser.parse_args(argv)
+
+    if not MEMORY_DIR.is_dir():
+        return 0
+    if args.command == "query":
+        # Abrir o índice (e esperar lock) já conta no limite de tempo do hook
+        deadline = Deadline(args.timeout)
+        conn = connect(timeout=args.timeout * REINDEX_SHARE)
+    else:
+        conn = connect()
+
+    if args.command == "update":
+        reindexed, removed, _ = update_index(conn)
+        print("✅ %d arquivos reindexados, %d removidos" % (reindexed, removed))
+    elif args.command == "query":
+        task = args.task
+        if task is None and not sys.stdin.isatty():
+            task = sys.stdin.read()
+        output = inject(conn, task, args.k, args.budget, max(0.0, deadline.end - time.monotonic()))
+        if output:
+            print(output)
+    elif args.command == "compact":
+        removed, compacted = compact_snapshots(keep=args.keep)
+        update_index(conn)
+        print("✅ %d snapshots duplicados removidos, %d compactados" % (removed, compacted))
+    elif args.command == "stats":
+        files = conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+        for kind, count in conn.execute("SELECT kind, COUNT(*) FROM entries GROUP BY kind ORDER BY kind"):
+            print("%-20s %d" % (kind, count))
+        print("%-20s %d" % ("arquivos", files))
+    conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
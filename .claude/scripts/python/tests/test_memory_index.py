@@ -0,0 +1,126 @@
+# Testes do índice de memória: pytest .claude/scripts/python/tests -q
+import os
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+import memory_index  # noqa: E402
+from memory_index import Deadline, compact_snapshots, connect, inject, search, update_index  # noqa: E402
+
+ERRORS = """# Erros Resolvidos
+
+## Docker build falha no indexer
+Copiar embeddings/ antes de rodar o indexer.
+
+## ModuleNotFoundError langchain_community
+Fixar a versão do langchain-community.
+"""
+
+
+@pytest.fixture
+def memory(tmp_path):
+    memory_dir = tmp_path / "memory"
+    (memory_dir / "errors").mkdir(parents=True)
+    (memory_dir / "errors" / "ERRORS-SOLVED.md").write_text(ERRORS, encoding="utf-8")
+    conn = connect(memory_dir / ".index" / "memory.sqlite")
+    yield memory_dir, conn
+    conn.close()
+
+
+def add_notes(memory_dir, count):
+    notes = memory_dir / "learnings"
+    notes.mkdir(exist_ok=True)
+    for i in range(count):
+        (notes / f"note-{i}.md").write_text(f"# Nota {i}\n\nConteúdo sem relação {i}.\n", encoding="utf-8")
+
+
+def test_update_is_incremental(memory):
+    memory_dir, conn = memory
+    assert update_index(conn, memory_dir) == (1, 0, 0)
+    assert update_index(conn, memory_dir) == (0, 0, 0)
+
+    path = memory_dir / "errors" / "ERRORS-SOLVED.md"
+    path.write_text(ERRORS + "\n## Novo erro\nDetalhes.\n", encoding="utf-8")
+    assert update_index(conn, memory_dir) == (1, 0, 0)
+    path.unlink()
+    assert update_index(conn, memory_dir) == (0, 1, 0)
+
+
+def test_expired_reindex_deadline_keeps_existing_index_queryable(memory):
+    memory_dir, conn = memory
+    update_index(conn, memory_dir)
+    add_notes(memory_dir, 50)
+
+    reindexed, _, skipped = update_index(conn, memory_dir, deadline=Deadline(0))
+    assert (reindexed, skipped) == (0, 51)
+    results = search(conn, "docker build", deadline=Deadline(1.0))
+    assert [entry["title"] for entry in results][:1] == ["Docker build falha no indexer"]
+
+
+def test_slow_reindex_stays_within_timeout(memory, monkeypatch):
+    memory_dir, conn = memory
+    update_index(conn, memory_dir)
+    add_notes(memory_dir, 40)
+    (memory_dir / "learnings" / "huge.md").write_text("## Enorme\n" + "x" * (memory_index.MAX_INLINE_BYTES + 1),
+                                                      encoding="utf-8")
+    split_entries = memory_index.split_entries
+
+    def slow_split(text, fallback_title):
+        time.sleep(0.03)  # 40 arquivos × 30ms: bem mais que o timeout inteiro
+        return split_entries(text, fallback_title)
+
+    monkeypatch.setattr(memory_index, "split_entries", slow_split)
+    start = time.monotonic()
+    output = inject(conn, "erro no docker build", timeout=0.2, memory_dir=memory_dir)
+    assert time.monotonic() - start <= 0.2 + 0.02
+    assert "Docker build falha no indexer" in output
+    indexed = {row[0] for row in conn.execute("SELECT path FROM files")}
+    assert 1 < len(indexed) < 42 and "learnings/huge.md" not in indexed
+
+
+def test_locked_index_falls_back_to_existing_entries(memory):
+    memory_dir, conn = memory
+    update_index(conn, memory_dir)
+    add_notes(memory_dir, 5)
+
+    writer = connect(memory_dir / ".index" / "memory.sqlite")
+    writer.execute("BEGIN IMMEDIATE")  # um `update` em paralelo segurando o lock de escrita
+    try:
+        start = time.monotonic()
+        output = inject(conn, "erro no docker build", timeout=0.3, memory_dir=memory_dir)
+        elapsed = time.monotonic() - start
+    finally:
+        writer.rollback()
+        writer.close()
+    assert "Docker build falha no indexer" in output
+    assert elapsed < 0.3 + 0.05
+
+
+def test_render_respects_token_budget(memory):
+    memory_dir, conn = memory
+    (memory_dir / "errors" / "BIG.md").write_text("## Docker enorme\n" + "docker " * 2000, encoding="utf-8")
+    output = inject(conn, "docker", budget=100, memory_dir=memory_dir)
+    assert memory_index.estimate_tokens(output) <= 100 + 10
+    assert output.endswith("[...]")
+
+
+def test_compact_removes_duplicates_and_keeps_recent(tmp_path):
+    snapshots = tmp_path / memory_index.SNAPSHOT_DIR
+    snapshots.mkdir()
+    for i in range(5):
+        path = snapshots / f"s{i}.md"
+        path.write_text(f"# Snapshot {i}\n\nTarefa: indexer\n\nItem {i}\n", encoding="utf-8")
+        os.utime(path, (1000 + i, 1000 + i))
+    duplicate = snapshots / "copy.md"
+    duplicate.write_text((snapshots / "s0.md").read_text(encoding="utf-8"), encoding="utf-8")
+    os.utime(duplicate, (999, 999))
+
+    assert compact_snapshots(tmp_path, keep=2) == (1, 2)
+    assert duplicate.exists() and not (snapshots / "s0.md").exists()  # a cópia mais antiga fica
+    compacted = (snapshots / "s1.md").read_text(encoding="utf-8")
+    assert "Tarefa: indexer" not in compacted and "Item 1" in compacted
+    assert "Tarefa: indexer" in (snapshots / "s4.md").read_text(encoding="utf-8")